@@ -1,6 +1,14 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session
+from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session, Response, send_file, stream_with_context, current_app
 import json
+import hashlib
+import html
+import importlib.util
+import io
+import zipfile
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import load_only
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from flask_migrate import Migrate
 from flask_wtf.csrf import CSRFProtect
@@ -8,14 +16,115 @@ from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta
+import math
+import operator
 import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
 import bleach
 
+# Argon2id is preferred for password hashing when argon2-cffi is installed;
+# otherwise new hashes fall back to Werkzeug's default scheme
+try:
+    from argon2 import PasswordHasher
+    from argon2.exceptions import InvalidHashError, VerificationError
+    password_hasher = PasswordHasher(time_cost=2, memory_cost=64 * 1024, parallelism=2)
+except ImportError:
+    password_hasher = None
+
+# Prompt templates. Each call sends the fixed instructions as the system
+# message and only the user's own text in the user message, so the
+# instruction prefix is byte-identical across calls and eligible for
+# OpenAI's automatic prompt caching.
+REFLECTION_QUESTIONS_PROMPTS = {
+    'quick': """Role: warm journaling companion.
+Task: 3 reflection questions about the user's day, in a caring friend's conversational voice.
+Reference specific events; explore feelings and mood shifts; no clinical wording.
+Output: questions only, one per line, unnumbered.""",
+    'detailed': """Role: thoughtful journaling companion.
+Task: 5 deep reflection questions about the user's day.
+Be warm and specific; invite vulnerability; link events to patterns and growth; encourage self-compassion.
+Output: questions only, one per line, unnumbered."""
+}
+
+JOURNAL_INSIGHTS_PROMPTS = {
+    'quick': """Task: 2-3 brief, encouraging insights on the user's journal entry: emotional patterns, growth, positives.
+Output: insights only, one per line.""",
+    'detailed': """Task: 3-5 meaningful, actionable insights on the user's journal entry: emotional patterns, growth, relationships, lessons, what's ahead.
+Output: insights only, one per line."""
+}
+
+CONVERSATIONAL_QUESTIONS_PROMPTS = {
+    'quick': """Role: caring friend in conversation about the user's day.
+Task: 3 specific follow-up questions that show you're listening; acknowledge good and hard moments.
+Output: questions only, one per line, unnumbered.""",
+    'detailed': """Role: empathetic friend in a deep conversation about the user's day.
+Task: 5 follow-up questions that validate feelings and gently explore emotional layers and lessons.
+Output: questions only, one per line, unnumbered."""
+}
+
+JOURNAL_SUMMARY_PROMPT = """Role: caring friend.
+Task: summarize the user's day, highlighting what mattered most emotionally, in warm reflective language that surfaces patterns or growth. Not clinical or generic.
+Length: {length}."""
+
+SUMMARY_LENGTHS = {
+    'quick': "2-3 sentences",
+    'detailed': "4-5 sentences"
+}
+
+ASSISTANT_RESPONSE_PROMPT = """Role: supportive friend who just read the user's journal entry.
+Task: reflect back what you heard, validate feelings, offer a gentle observation and optionally one follow-up question.
+Tone: encouraging, not forced-positive; a friend, not an AI or therapist."""
+
+MOOD_RESPONSE_PROMPT = """Role: supportive journaling assistant.
+Task: acknowledge the user's current mood with empathy, connect it to their day, and offer gentle guidance for processing it."""
+
+CONVERSATIONAL_SUMMARY_PROMPT = """Role: caring friend who just heard about the user's day and their answers to your questions.
+Task: warm summary in their own words and tone; validate feelings without judgment; note growth or insight.
+Tone: supportive friend, not therapist or AI.
+Length: {length}."""
+
+CONVERSATIONAL_SUMMARY_LENGTHS = {
+    'quick': "3-4 sentences",
+    'detailed': "5-6 sentences"
+}
+
+# Length-specific summary instructions, resolved once per mode
+JOURNAL_SUMMARY_PROMPTS = {mode: JOURNAL_SUMMARY_PROMPT.format(length=length)
+                           for mode, length in SUMMARY_LENGTHS.items()}
+CONVERSATIONAL_SUMMARY_PROMPTS = {mode: CONVERSATIONAL_SUMMARY_PROMPT.format(length=length)
+                                  for mode, length in CONVERSATIONAL_SUMMARY_LENGTHS.items()}
+
+# User messages carrying the per-call content
+DAY_MESSAGE = "Daily Summary: {daily_summary}"
+ENTRY_MESSAGE = "Daily Summary: {daily_summary}\nJournal Content: {journal_content}"
+MOOD_MESSAGE = "Daily Summary: {daily_summary}\nJournal Content: {journal_content}\nCurrent Mood: {mood}"
+ANSWERS_MESSAGE = "Daily Summary: {daily_summary}\n\nTheir responses to your questions:\n{answers_text}"
+
+def prompt_mode(mode):
+    """Map any non-quick mode onto the detailed prompt variants"""
+    return 'quick' if mode == 'quick' else 'detailed'
+
 # AI Service class integrated directly into app.py
 class AIService:
+    MODEL = "gpt-4o-mini"
+    EMBEDDING_MODEL = "text-embedding-3-small"
+    # OpenAI bills cached prompt tokens and Batch API requests at half price
+    CACHED_TOKEN_DISCOUNT = 0.5
+    BATCH_TOKEN_DISCOUNT = 0.5
+    
     def __init__(self):
+        # Caps in-flight OpenAI calls across all request threads
+        max_concurrent_calls = int(os.getenv('AI_MAX_CONCURRENT_CALLS', 32))
+        self._call_slots = threading.BoundedSemaphore(max_concurrent_calls)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent_calls, thread_name_prefix='ai')
+        self.monthly_token_limit = int(os.getenv('MONTHLY_TOKEN_LIMIT', 0))
         try:
+            import httpx
             from openai import OpenAI
             from dotenv import load_dotenv
             
@@ -24,7 +133,20 @@ class AIService:
             
             # Validate API key format
             if api_key and self._validate_api_key(api_key):
-                self.client = OpenAI(api_key=api_key)
+                # One client (and its connection pool) is shared by every request;
+                # the SDK retries rate limits and 5xx errors with exponential backoff.
+                # Idle connections are kept for every call slot so back-to-back calls
+                # skip the TLS handshake, and with h2 installed concurrent calls
+                # multiplex over a single HTTP/2 connection.
+                http_client = httpx.Client(
+                    http2=importlib.util.find_spec('h2') is not None,
+                    timeout=60,
+                    limits=httpx.Limits(
+                        max_connections=max_concurrent_calls,
+                        max_keepalive_connections=max_concurrent_calls
+                    )
+                )
+                self.client = OpenAI(api_key=api_key, max_retries=5, timeout=60, http_client=http_client)
                 self.available = True
                 # Log masked key for debugging (only first 8 chars visible)
                 masked_key = api_key[:8] + "*" * (len(api_key) - 8)
@@ -52,111 +174,116 @@ class AIService:
         
     def _check_usage_limits(self):
         """Check if we're within safe usage limits"""
-        # You can add daily/monthly usage tracking here
-        # For now, we'll just ensure the service is available
-        return self.available
+        if not self.available:
+            return False
+        # A limit of 0 means unlimited
+        if self.monthly_token_limit and get_monthly_token_usage() >= self.monthly_token_limit:
+            print("⚠️ Monthly AI token limit reached, using fallbacks")
+            return False
+        return True
     
-    def generate_reflection_questions(self, daily_summary, mode='quick'):
-        """Generate AI-powered reflection questions based on daily summary"""
-        if not self.available or not self._check_usage_limits():
-            return self._get_fallback_questions(mode), 0
-            
+    def _create_completion(self, **kwargs):
+        """Run a chat completion within the shared concurrency limit"""
+        with self._call_slots:
+            return self.client.chat.completions.create(**kwargs)
+    
+    def _embed(self, text):
+        """Embed text within the shared concurrency limit, returning (vector, tokens)"""
+        with self._call_slots:
+            response = self.client.embeddings.create(model=self.EMBEDDING_MODEL, input=text)
+        return response.data[0].embedding, response.usage.total_tokens
+    
+    def submit(self, method, *args, **kwargs):
+        """Run a method on a worker thread so the caller can overlap other work"""
+        app = current_app._get_current_object()
+        
+        def run():
+            with app.app_context():
+                try:
+                    return method(*args, **kwargs)
+                except Exception as e:
+                    # Fire-and-forget callers never read the Future, so log here
+                    print(f"Background task {getattr(method, '__name__', method)} failed: {e}")
+                    raise
+        
+        return self._executor.submit(run)
+    
+    def _billable_tokens(self, usage):
+        """Total tokens with cached prompt tokens counted at their discounted rate"""
+        details = getattr(usage, 'prompt_tokens_details', None)
+        cached_tokens = getattr(details, 'cached_tokens', 0) or 0
+        return usage.total_tokens - int(cached_tokens * self.CACHED_TOKEN_DISCOUNT)
+    
+    def _prompt_hash(self, messages, max_tokens):
+        """Content address for a completion request, used as the response cache key"""
+        key = f"{self.MODEL}\n{max_tokens}\n" + json.dumps(messages)
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+    
+    def _log_error(self, error):
+        """Log an AI failure without exposing API key details"""
+        error_msg = str(error).lower()
+        if 'api' in error_msg and 'key' in error_msg:
+            print("AI Error: API authentication issue")
+        else:
+            print(f"AI Error: {error}")
+    
+    def _messages(self, system, user):
+        """Static instructions first, per-call content last, so the prefix caches"""
+        return [
+            {"role": "system", "content": system},
+            {"role": "user", "content": user}
+        ]
+    
+    def _generate(self, system, user, max_tokens, fallback, as_lines=False):
+        """Run a single completion, returning (result, tokens)
+        
+        Falls back to fallback() with 0 tokens when AI is unavailable, over its
+        usage limit, or the call fails. as_lines splits the reply into a list.
+        """
+        if not self._check_usage_limits():
+            return fallback(), 0
+        
         try:
-            if mode == 'quick':
-                prompt = f"""You are a warm, supportive journaling companion. Based on this person's day: "{daily_summary}"
-
-                Generate exactly 3 personalized reflection questions that feel like they're coming from a caring friend who knows them well. 
-                
-                Guidelines:
-                - Make questions specific to their actual experiences and activities mentioned
-                - Use warm, conversational language ("How did that feel?" vs "What emotions did you experience?")
-                - Focus on emotional processing and self-discovery
-                - Avoid overly clinical or therapy-like language
-                - Make them feel seen and understood
-                - Reference specific events or activities they mentioned
-                - Ask about emotional transitions or mood changes they might have experienced
-                
-                Return only the questions, one per line, without numbering or extra text."""
+            messages = self._messages(system, user)
+            prompt_hash = self._prompt_hash(messages, max_tokens)
+            text = get_cached_response(prompt_hash)
+            if text is not None:
+                tokens = 0  # Repeat submissions are served from the cache for free
             else:
-                prompt = f"""You are a thoughtful journaling companion helping someone do deep self-reflection. Based on their day: "{daily_summary}"
-
-                Generate exactly 5 personalized questions that encourage profound self-exploration. 
-                
-                Guidelines:
-                - Make questions deeply personal and specific to their situation
-                - Use warm, encouraging language that invites vulnerability
-                - Focus on emotional depth, personal growth, and life insights
-                - Help them connect their experiences to broader life patterns
-                - Encourage self-compassion and understanding
-                - Make questions that feel like they're coming from someone who truly cares
-                
-                Return only the questions, one per line, without numbering or extra text."""
-            
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=200,
-                temperature=0.7
-            )
+                response = self._create_completion(
+                    model=self.MODEL,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=0.7
+                )
+                text = response.choices[0].message.content.strip()
+                tokens = self._billable_tokens(response.usage)
+                # Saved in the background so the reply isn't held up
+                self.submit(record_completion, prompt_hash, text, tokens)
             
-            questions = response.choices[0].message.content.strip().split('\n')
-            questions = [q.strip() for q in questions if q.strip()]
-            
-            return questions, response.usage.total_tokens
+            if as_lines:
+                text = [line.strip() for line in text.split('\n') if line.strip()]
+            return text, tokens
             
         except Exception as e:
-            # Don't expose API key in error messages
-            error_msg = str(e).lower()
-            if 'api' in error_msg and 'key' in error_msg:
-                print("AI Error: API authentication issue")
-            else:
-                print(f"AI Error: {e}")
-            return self._get_fallback_questions(mode), 0
+            self._log_error(e)
+            return fallback(), 0
+    
+    def generate_reflection_questions(self, daily_summary, mode='quick'):
+        """Generate AI-powered reflection questions based on daily summary"""
+        return self._generate(
+            REFLECTION_QUESTIONS_PROMPTS[prompt_mode(mode)],
+            DAY_MESSAGE.format(daily_summary=daily_summary),
+            200, lambda: self._get_fallback_questions(mode), as_lines=True
+        )
     
     def enhance_journal_entry(self, daily_summary, journal_content, mode='quick'):
         """Enhance journal entry with AI insights"""
-        if not self.available:
-            return self._get_fallback_insights(mode), 0
-            
-        try:
-            if mode == 'quick':
-                prompt = f"""Daily Summary: {daily_summary}
-                Journal Content: {journal_content}
-                
-                Provide 2-3 brief insights or observations about this journal entry. Focus on:
-                - Emotional patterns
-                - Growth opportunities
-                - Positive aspects
-                
-                Keep insights concise and encouraging. Return only the insights, one per line."""
-            else:
-                prompt = f"""Daily Summary: {daily_summary}
-                Journal Content: {journal_content}
-                
-                Provide 3-5 thoughtful insights about this journal entry. Focus on:
-                - Emotional depth and patterns
-                - Personal growth and learning
-                - Relationship insights
-                - Life wisdom and lessons
-                - Future considerations
-                
-                Make insights meaningful and actionable. Return only the insights, one per line."""
-            
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=300,
-                temperature=0.7
-            )
-            
-            insights = response.choices[0].message.content.strip().split('\n')
-            insights = [i.strip() for i in insights if i.strip()]
-            
-            return insights, response.usage.total_tokens
-            
-        except Exception as e:
-            print(f"AI Error: {e}")
-            return self._get_fallback_insights(mode), 0
+        return self._generate(
+            JOURNAL_INSIGHTS_PROMPTS[prompt_mode(mode)],
+            ENTRY_MESSAGE.format(daily_summary=daily_summary, journal_content=journal_content),
+            300, lambda: self._get_fallback_insights(mode), as_lines=True
+        )
     
     def _get_fallback_questions(self, mode):
         """Fallback questions when AI is not available"""
@@ -196,105 +323,27 @@ class AIService:
     
     def generate_journal_summary(self, daily_summary, mode='quick'):
         """Generate a comprehensive summary of the journal entry"""
-        if not self.available:
-            return self._get_fallback_summary(daily_summary, mode), 0
-            
-        try:
-            prompt = f"""You're helping someone create a meaningful summary of their day: "{daily_summary}"
-
-            Write a thoughtful summary that captures the essence of their experience. 
-            
-            Guidelines:
-            - Focus on what matters most to them emotionally and personally
-            - Highlight key moments, feelings, and insights
-            - Use warm, reflective language that honors their experience
-            - Help them see patterns or growth in their day
-            - Make it feel like a caring friend's perspective on their day
-            - Avoid being overly clinical or generic
-            
-            Write as if you're helping them remember and appreciate their day. {f"Keep it to 2-3 sentences for quick mode" if mode == 'quick' else "4-5 sentences for detailed mode"}."""
-            
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=200,
-                temperature=0.7
-            )
-            
-            summary = response.choices[0].message.content.strip()
-            return summary, response.usage.total_tokens
-            
-        except Exception as e:
-            print(f"AI Error: {e}")
-            return self._get_fallback_summary(daily_summary, mode), 0
+        return self._generate(
+            JOURNAL_SUMMARY_PROMPTS[prompt_mode(mode)],
+            DAY_MESSAGE.format(daily_summary=daily_summary),
+            200, lambda: self._get_fallback_summary(daily_summary, mode)
+        )
     
     def generate_assistant_response(self, daily_summary, journal_content, mode='quick'):
         """Generate an interactive assistant response to help with journaling"""
-        if not self.available:
-            return self._get_fallback_assistant_response(mode), 0
-            
-        try:
-            prompt = f"""You're a warm, supportive friend who just read someone's journal entry about their day.
-
-            Their day: {daily_summary}
-            What they wrote: {journal_content}
-            
-            Respond as a caring friend would:
-            - Show genuine understanding and empathy
-            - Reflect back what you heard with warmth
-            - Offer gentle insights or observations
-            - Ask one thoughtful follow-up question if appropriate
-            - Validate their experience and feelings
-            - Be encouraging without being overly positive
-            
-            Sound like someone who truly cares about them, not an AI or therapist.
-            Keep it conversational and heartfelt."""
-            
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=300,
-                temperature=0.7
-            )
-            
-            assistant_response = response.choices[0].message.content.strip()
-            return assistant_response, response.usage.total_tokens
-            
-        except Exception as e:
-            print(f"AI Error: {e}")
-            return self._get_fallback_assistant_response(mode), 0
+        return self._generate(
+            ASSISTANT_RESPONSE_PROMPT,
+            ENTRY_MESSAGE.format(daily_summary=daily_summary, journal_content=journal_content),
+            300, lambda: self._get_fallback_assistant_response(mode)
+        )
     
     def generate_mood_response(self, daily_summary, journal_content, mood, mode='quick'):
         """Generate a response based on the user's mood to help explore emotions"""
-        if not self.available:
-            return self._get_fallback_mood_response(mood, mode), 0
-            
-        try:
-            prompt = f"""Daily Summary: {daily_summary}
-            Journal Content: {journal_content}
-            Current Mood: {mood}
-            
-            As a supportive journaling assistant, respond to their mood change:
-            - Acknowledge their emotional state with empathy
-            - Help them explore why they might be feeling this way
-            - Connect their mood to the events they described
-            - Offer gentle guidance for emotional processing
-            
-            Be warm, understanding, and helpful. Help them gain insight into their emotions."""
-            
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=250,
-                temperature=0.7
-            )
-            
-            mood_response = response.choices[0].message.content.strip()
-            return mood_response, response.usage.total_tokens
-            
-        except Exception as e:
-            print(f"AI Error: {e}")
-            return self._get_fallback_mood_response(mood, mode), 0
+        return self._generate(
+            MOOD_RESPONSE_PROMPT,
+            MOOD_MESSAGE.format(daily_summary=daily_summary, journal_content=journal_content, mood=mood),
+            250, lambda: self._get_fallback_mood_response(mood, mode)
+        )
     
     def _get_fallback_summary(self, daily_summary, mode):
         """Fallback summary when AI is not available"""
@@ -321,92 +370,173 @@ class AIService:
         }
         return mood_responses.get(mood, "Your mood is an important part of your journaling experience. How does this emotional state relate to what happened today?")
     
-    def generate_conversational_questions(self, daily_summary, mode='quick'):
-        """Generate conversational questions focused on emotions and feelings"""
-        if not self.available:
-            return self._get_fallback_conversational_questions(mode), 0
-            
-        try:
-            if mode == 'quick':
-                prompt = f"""You're having a heartfelt conversation with someone about their day: "{daily_summary}"
-
-                Ask exactly 3 follow-up questions that show you're really listening and care about their experience. 
-                
-                Guidelines:
-                - Be genuinely curious about their emotional experience
-                - Use natural, conversational language ("That sounds..." "I'm curious about...")
-                - Acknowledge both positive and difficult emotions
-                - Make them feel heard and validated
-                - Avoid generic questions - be specific to their situation
-                
-                Return only the questions, one per line, without numbering or extra text."""
+    def generate_conversational_questions(self, daily_summary, mode='quick', user_id=None):
+        """Generate conversational questions focused on emotions and feelings
+        
+        With a user_id, questions generated for a near-identical earlier summary
+        of theirs are reused instead of calling the chat model again.
+        """
+        mode = prompt_mode(mode)
+        embedding, embed_tokens = None, 0
+        if user_id is not None and self._check_usage_limits():
+            try:
+                embedding, embed_tokens = self._embed(daily_summary)
+                questions = find_similar_questions(user_id, mode, embedding)
+                if questions:
+                    self.submit(record_completion, None, None, embed_tokens)
+                    return questions, embed_tokens
+            except Exception as e:
+                self._log_error(e)
+        
+        questions, tokens = self._generate(
+            CONVERSATIONAL_QUESTIONS_PROMPTS[mode],
+            DAY_MESSAGE.format(daily_summary=daily_summary),
+            300, lambda: self._get_fallback_conversational_questions(mode), as_lines=True
+        )
+        # Zero tokens means a fallback or an exact-match cache hit, neither worth
+        # storing; otherwise the embedding is billed in the cache write's commit
+        if embedding and tokens:
+            self.submit(cache_questions, user_id, mode, embedding, questions, embed_tokens)
+        elif embed_tokens:
+            self.submit(record_completion, None, None, embed_tokens)
+        return questions, tokens + embed_tokens
+    
+    def _format_answers(self, user_answers, questions=None):
+        """Pair each non-blank answer with its question for the summary prompt"""
+        questions = questions or []
+        pairs = []
+        for i, answer in enumerate(user_answers):
+            if not answer or not answer.strip():
+                continue
+            if i < len(questions):
+                pairs.append(f"Q{i+1}: {questions[i]}\nA{i+1}: {answer.strip()}")
             else:
-                prompt = f"""You're having a deep, meaningful conversation with someone about their day: "{daily_summary}"
-
-                Ask exactly 5 thoughtful follow-up questions that help them process their experience more deeply.
-                
-                Guidelines:
-                - Show genuine empathy and understanding
-                - Use warm, supportive language that invites sharing
-                - Help them explore the emotional layers of their experience
-                - Encourage self-reflection and personal growth
-                - Validate their feelings while gently encouraging deeper exploration
-                - Make questions that feel like they're coming from someone who truly understands
-                
-                Return only the questions, one per line, without numbering or extra text."""
-            
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=300,
-                temperature=0.7
-            )
-            
-            questions = response.choices[0].message.content.strip().split('\n')
-            questions = [q.strip() for q in questions if q.strip()]
-            
-            return questions, response.usage.total_tokens
-            
-        except Exception as e:
-            print(f"AI Error: {e}")
-            return self._get_fallback_conversational_questions(mode), 0
+                pairs.append(f"Q{i+1}: {answer.strip()}")
+        return "\n\n".join(pairs)
     
-    def generate_conversational_summary(self, daily_summary, user_answers, mode='quick'):
+    def _conversational_summary_message(self, daily_summary, user_answers, questions=None):
+        """Build the user message shared by the blocking and streaming summary calls"""
+        return ANSWERS_MESSAGE.format(
+            daily_summary=daily_summary,
+            answers_text=self._format_answers(user_answers, questions)
+        )
+    
+    def generate_conversational_summary(self, daily_summary, user_answers, mode='quick', questions=None):
         """Generate a conversational summary that preserves raw emotions"""
-        if not self.available:
-            return self._get_fallback_conversational_summary(daily_summary, user_answers, mode), 0
-            
+        return self._generate(
+            CONVERSATIONAL_SUMMARY_PROMPTS[prompt_mode(mode)],
+            self._conversational_summary_message(daily_summary, user_answers, questions),
+            400,
+            lambda: self._get_fallback_conversational_summary(daily_summary, user_answers, mode)
+        )
+    
+    def stream_conversational_summary(self, daily_summary, user_answers, mode='quick', questions=None):
+        """Yield the conversational summary in chunks as the model writes it"""
+        if not self._check_usage_limits():
+            yield self._get_fallback_conversational_summary(daily_summary, user_answers, mode)
+            return
+        
+        started = False
         try:
-            prompt = f"""You're a caring friend who just listened to someone share about their day. Here's what they told you:
-
-            Daily Summary: {daily_summary}
-            
-            Their responses to your questions:
-            {chr(10).join([f"Q{i+1}: {answer}" for i, answer in enumerate(user_answers)])}
-            
-            Write a warm, empathetic summary that:
-            - Reflects back what you heard with genuine understanding
-            - Honors their emotional experience without judgment
-            - Uses their own words and emotional tone when possible
-            - Shows you truly listened and care about their experience
-            - Validates their feelings while highlighting any growth or insights
-            - Sounds like a supportive friend, not a therapist or AI
-            
-            Keep it conversational and heartfelt. {f"3-4 sentences for quick mode" if mode == 'quick' else "5-6 sentences for detailed mode"}."""
+            messages = self._messages(
+                CONVERSATIONAL_SUMMARY_PROMPTS[prompt_mode(mode)],
+                self._conversational_summary_message(daily_summary, user_answers, questions)
+            )
+            prompt_hash = self._prompt_hash(messages, 400)
+            cached = get_cached_response(prompt_hash)
+            if cached is not None:
+                yield cached
+                return
             
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": prompt}],
+            stream = self._create_completion(
+                model=self.MODEL,
+                messages=messages,
                 max_tokens=400,
-                temperature=0.7
+                temperature=0.7,
+                stream=True,
+                stream_options={"include_usage": True}
             )
             
-            summary = response.choices[0].message.content.strip()
-            return summary, response.usage.total_tokens
-            
+            parts = []
+            tokens = 0
+            for chunk in stream:
+                # The final chunk carries usage and no choices
+                if chunk.usage:
+                    tokens = self._billable_tokens(chunk.usage)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    started = True
+                    parts.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+            self.submit(record_completion, prompt_hash, ''.join(parts).strip(), tokens)
+                    
+        except Exception as e:
+            self._log_error(e)
+            # Only fall back if nothing has reached the client yet
+            if not started:
+                yield self._get_fallback_conversational_summary(daily_summary, user_answers, mode)
+    
+    def submit_summary_batch(self, daily_summary, user_answers, mode='quick', questions=None):
+        """Queue the conversational summary on the Batch API, returning the batch id
+        
+        Returns None when AI is unavailable, over its usage limit, or the
+        upload fails, so the caller can generate the summary directly.
+        """
+        if not self._check_usage_limits():
+            return None
+        
+        try:
+            request_line = json.dumps({
+                "custom_id": "summary",
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": self.MODEL,
+                    "messages": self._messages(
+                        CONVERSATIONAL_SUMMARY_PROMPTS[prompt_mode(mode)],
+                        self._conversational_summary_message(daily_summary, user_answers, questions)
+                    ),
+                    "max_tokens": 400,
+                    "temperature": 0.7
+                }
+            })
+            with self._call_slots:
+                batch_file = self.client.files.create(
+                    file=("summary.jsonl", request_line.encode('utf-8')),
+                    purpose="batch"
+                )
+                batch = self.client.batches.create(
+                    input_file_id=batch_file.id,
+                    endpoint="/v1/chat/completions",
+                    completion_window="24h"
+                )
+            return batch.id
         except Exception as e:
-            print(f"AI Error: {e}")
-            return self._get_fallback_conversational_summary(daily_summary, user_answers, mode), 0
+            self._log_error(e)
+            return None
+    
+    def fetch_batch_summary(self, batch_id):
+        """Check a queued summary, returning (status, summary, tokens)
+        
+        status is 'pending' while the batch runs, 'completed' with the summary,
+        or 'failed' when the batch ended without a usable result.
+        """
+        # A status poll is cheap and retried on the next check, so fail fast
+        # instead of inheriting the shared client's long timeout and retries
+        client = self.client.with_options(timeout=5, max_retries=0)
+        batch = client.batches.retrieve(batch_id)
+        if batch.status in ('validating', 'in_progress', 'finalizing'):
+            return 'pending', None, 0
+        if batch.status != 'completed' or not batch.output_file_id:
+            return 'failed', None, 0
+        output = client.files.content(batch.output_file_id).text
+        
+        result = json.loads(output.splitlines()[0])
+        body = (result.get('response') or {}).get('body') or {}
+        if not body.get('choices'):
+            return 'failed', None, 0
+        summary = body['choices'][0]['message']['content'].strip()
+        tokens = int(body.get('usage', {}).get('total_tokens', 0) * self.BATCH_TOKEN_DISCOUNT)
+        return 'completed', summary, tokens
     
     def _get_fallback_conversational_questions(self, mode):
         """Fallback conversational questions when AI is not available"""
@@ -463,6 +593,14 @@ if database_url:
     if database_url.startswith('postgres://'):
         database_url = database_url.replace('postgres://', 'postgresql://', 1)
     app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    # Reuse pooled connections across requests; ping before use and recycle
+    # before the provider's idle timeout so a dropped connection never surfaces
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_size': 5,
+        'max_overflow': 10,
+        'pool_pre_ping': True,
+        'pool_recycle': 300
+    }
     print(f"Using PostgreSQL database: {database_url[:50]}...")
 else:
     # Development: SQLite
@@ -479,6 +617,31 @@ def sanitize_input(text):
     allowed_tags = ['p', 'br', 'strong', 'em', 'u', 'ol', 'ul', 'li']
     return bleach.clean(text, tags=allowed_tags, strip=True)
 
+def hash_password(password):
+    """Hash a password with Argon2id, or Werkzeug's default without argon2-cffi"""
+    if password_hasher:
+        return password_hasher.hash(password)
+    return generate_password_hash(password)
+
+def verify_password(password_hash, password):
+    """Check a password against an Argon2 or a legacy Werkzeug hash"""
+    if password_hash.startswith('$argon2'):
+        if not password_hasher:
+            return False
+        try:
+            return password_hasher.verify(password_hash, password)
+        except (VerificationError, InvalidHashError):
+            return False
+    return check_password_hash(password_hash, password)
+
+def password_needs_rehash(password_hash):
+    """True when a stored hash predates the current Argon2 parameters"""
+    if not password_hasher:
+        return False
+    if not password_hash.startswith('$argon2'):
+        return True
+    return password_hasher.check_needs_rehash(password_hash)
+
 def validate_password_strength(password):
     """Validate password strength"""
     if len(password) < 8:
@@ -491,6 +654,83 @@ def validate_password_strength(password):
         return False, "Password must contain at least one number"
     return True, "Password is strong"
 
+# Mood analytics cache - payloads are pure functions of (user, range, day), so
+# repeat range switches and page reloads skip the query and serialization.
+# A user's entries are dropped whenever they record a new mood.
+MOOD_ANALYTICS_CACHE_SIZE = 24
+_mood_analytics_cache = OrderedDict()
+_mood_analytics_lock = threading.Lock()
+
+def get_cached_mood_analytics(key):
+    """Return a cached mood analytics payload, or None on a miss"""
+    with _mood_analytics_lock:
+        payload = _mood_analytics_cache.get(key)
+        if payload is not None:
+            _mood_analytics_cache.move_to_end(key)
+        return payload
+
+def cache_mood_analytics(key, payload):
+    """Store a mood analytics payload, evicting the least recently used"""
+    with _mood_analytics_lock:
+        _mood_analytics_cache[key] = payload
+        _mood_analytics_cache.move_to_end(key)
+        while len(_mood_analytics_cache) > MOOD_ANALYTICS_CACHE_SIZE:
+            _mood_analytics_cache.popitem(last=False)
+
+def invalidate_mood_analytics(user_id):
+    """Drop every cached mood analytics payload for a user"""
+    with _mood_analytics_lock:
+        for key in [k for k in _mood_analytics_cache if k[0] == user_id]:
+            del _mood_analytics_cache[key]
+
+# Fixed pieces of the plain-text download format, built once rather than
+# per entry (an export renders every entry the user has)
+ENTRY_TEXT_RULE = '─' * 79
+ENTRY_TEXT_BANNER = '═' * 79
+ENTRY_TEXT_TITLE = f"{'📖 MindFlow Journal Entry':^79}"
+ENTRY_TEXT_FOOTER = ('', ENTRY_TEXT_BANNER, 'Generated by MindFlow - Your Personal Journaling Companion',
+                     'Visit: https://mindflow.app', ENTRY_TEXT_BANNER)
+
+def format_entry_text(entry):
+    """Render a journal entry as the plain-text download format"""
+    def indent(text):
+        # Stored text is bleach-cleaned, so decode its entities for plain text
+        return html.unescape(text or '').replace('\n', '\n    ').strip()
+    
+    rule = ENTRY_TEXT_RULE
+    sections = [
+        ENTRY_TEXT_TITLE,
+        f"{entry.entry_date.strftime('%B %d, %Y'):^79}",
+        ENTRY_TEXT_BANNER,
+        '',
+        '📝 DAILY SUMMARY', rule, indent(entry.daily_summary), '',
+        '💭 YOUR REFLECTION', rule, indent(entry.journal_content), ''
+    ]
+    
+    try:
+        questions = json.loads(entry.questions) if entry.questions else []
+        answers = json.loads(entry.answers) if entry.answers else []
+    except (ValueError, TypeError) as e:
+        print(f"JSON parsing error: {e}, entry: {entry.id}")
+        questions, answers = [], []
+    if questions:
+        sections += ['❓ REFLECTION QUESTIONS', rule]
+        sections += [f"{i}. {indent(q)}" for i, q in enumerate(questions, 1)]
+        sections.append('')
+        if answers:
+            sections += ['💬 YOUR ANSWERS', rule]
+            sections += [f"{i}. {indent(a)}" for i, a in enumerate(answers, 1)]
+            sections.append('')
+    
+    sections += ['📊 ENTRY DETAILS', rule, f"• Mode: {entry.mode.title()}",
+                 f"• Created: {entry.created_at.strftime('%B %d, %Y at %I:%M %p')}"]
+    if entry.updated_at and entry.updated_at != entry.created_at:
+        sections.append(f"• Updated: {entry.updated_at.strftime('%B %d, %Y at %I:%M %p')}")
+    if entry.tokens_used:
+        sections.append(f"• AI Tokens Used: {entry.tokens_used}")
+    sections += ENTRY_TEXT_FOOTER
+    return '\n'.join(sections)
+
 # Custom Jinja2 filters
 @app.template_filter('from_json')
 def from_json_filter(value):
@@ -509,6 +749,15 @@ def from_json_filter(value):
         print(f"JSON parsing error: {e}, value: {repr(value)}")
         return []
 
+@event.listens_for(Engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Use WAL journaling for SQLite so commits skip the rollback-journal fsync"""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
 db = SQLAlchemy(app)
 migrate = Migrate(app, db)
 csrf = CSRFProtect(app)
@@ -537,6 +786,12 @@ class User(UserMixin, db.Model):
     mood_entries = db.relationship('MoodEntry', backref='user', lazy=True)
 
 class JournalEntry(db.Model):
+    # Entry lists are always per user, newest first by entry or creation date
+    __table_args__ = (
+        db.Index('ix_journal_entry_user_date', 'user_id', 'entry_date'),
+        db.Index('ix_journal_entry_user_created', 'user_id', 'created_at'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     entry_date = db.Column(db.Date, nullable=False)
@@ -550,6 +805,11 @@ class JournalEntry(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class MoodEntry(db.Model):
+    # Every mood read filters by user and a date range
+    __table_args__ = (
+        db.Index('ix_mood_entry_user_date', 'user_id', 'entry_date'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     entry_date = db.Column(db.Date, nullable=False)
@@ -557,6 +817,353 @@ class MoodEntry(db.Model):
     notes = db.Column(db.Text)  # Optional notes about the mood
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+class TokenUsage(db.Model):
+    """Running total of AI tokens billed per calendar month"""
+    month = db.Column(db.String(7), primary_key=True)  # YYYY-MM
+    total_tokens = db.Column(db.Integer, nullable=False, default=0)
+
+def current_month():
+    """Return the current UTC month as YYYY-MM, the token usage key"""
+    now = datetime.utcnow()
+    return f"{now.year:04d}-{now.month:02d}"
+
+# Limit checks run before every AI call, so the monthly total is memoized
+# briefly; record_completion refreshes it so this process sees its own writes.
+TOKEN_USAGE_CACHE_TTL = 5  # seconds
+_token_usage_cache = {'month': None, 'total_tokens': 0, 'expires': 0.0}
+
+def get_monthly_token_usage():
+    """Return the tokens billed so far this month"""
+    month = current_month()
+    now = time.monotonic()
+    if _token_usage_cache['month'] == month and now < _token_usage_cache['expires']:
+        return _token_usage_cache['total_tokens']
+    
+    usage = db.session.get(TokenUsage, month)
+    total_tokens = usage.total_tokens if usage else 0
+    _token_usage_cache.update(month=month, total_tokens=total_tokens, expires=now + TOKEN_USAGE_CACHE_TTL)
+    return total_tokens
+
+def refresh_token_usage_cache(month, total_tokens):
+    """Store the total an upsert reported, so the next limit check needs no read"""
+    _token_usage_cache.update(month=month, total_tokens=total_tokens,
+                              expires=time.monotonic() + TOKEN_USAGE_CACHE_TTL)
+
+def dialect_insert(model):
+    """INSERT construct for the active dialect, which supports ON CONFLICT"""
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model)
+
+def token_usage_upsert(month, tokens):
+    """Atomic upsert adding tokens to a month's total and returning the new total"""
+    stmt = dialect_insert(TokenUsage).values(month=month, total_tokens=tokens)
+    return stmt.on_conflict_do_update(
+        index_elements=['month'],
+        set_={'total_tokens': TokenUsage.total_tokens + stmt.excluded.total_tokens}
+    ).returning(TokenUsage.total_tokens)
+
+# Entry lists only show the date, mode and a summary preview
+ENTRY_LIST_COLUMNS = (
+    JournalEntry.id,
+    JournalEntry.entry_date,
+    JournalEntry.mode,
+    JournalEntry.daily_summary,
+    JournalEntry.created_at
+)
+
+ENTRIES_PER_PAGE = 10
+
+def encode_entry_cursor(entry):
+    """Encode an entry's position in the newest-first list as a page cursor"""
+    return f"{entry.created_at.isoformat()}_{entry.id}"
+
+def get_entry_page(user_id, cursor=None, limit=ENTRIES_PER_PAGE):
+    """Return a page of a user's entries, newest first, and the next page's cursor"""
+    query = JournalEntry.query.filter_by(user_id=user_id)\
+        .options(load_only(*ENTRY_LIST_COLUMNS))
+    if cursor:
+        # Keyset pagination: seek past the last entry shown instead of OFFSET
+        created_at, entry_id = cursor.rsplit('_', 1)
+        query = query.filter(db.tuple_(JournalEntry.created_at, JournalEntry.id) <
+                             (datetime.fromisoformat(created_at), int(entry_id)))
+    entries = query.order_by(JournalEntry.created_at.desc(), JournalEntry.id.desc())\
+        .limit(limit + 1).all()
+    
+    # The extra row only tells us whether another page exists
+    next_cursor = encode_entry_cursor(entries[limit - 1]) if len(entries) > limit else None
+    return entries[:limit], next_cursor
+
+def get_user_stats(user_id):
+    """Collect a user's journaling stats with a single aggregate query"""
+    mood_count = db.select(db.func.count(MoodEntry.id))\
+        .where(MoodEntry.user_id == user_id).scalar_subquery()
+    total, quick, detailed, tokens, moods = db.session.query(
+        db.func.count(JournalEntry.id),
+        db.func.coalesce(db.func.sum(db.case((JournalEntry.mode == 'quick', 1), else_=0)), 0),
+        db.func.coalesce(db.func.sum(db.case((JournalEntry.mode == 'detailed', 1), else_=0)), 0),
+        db.func.coalesce(db.func.sum(JournalEntry.tokens_used), 0),
+        mood_count
+    ).filter(JournalEntry.user_id == user_id).one()
+    
+    return {
+        'total_entries': total,
+        'quick_entries': quick,
+        'detailed_entries': detailed,
+        'tokens_used': tokens,
+        'mood_records': moods
+    }
+
+class ResponseCache(db.Model):
+    """AI completions keyed by a hash of model, token budget and prompt"""
+    prompt_hash = db.Column(db.String(64), primary_key=True)
+    response = db.Column(db.Text, nullable=False)
+    tokens = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+def get_cached_response(prompt_hash):
+    """Return a cached completion for prompt_hash, or None on a miss"""
+    cached = db.session.get(ResponseCache, prompt_hash)
+    return cached.response if cached else None
+
+def record_completion(prompt_hash, response, tokens):
+    """Cache a completion and bill its tokens in a single transaction"""
+    month = current_month()
+    total_tokens = None
+    try:
+        # A concurrent identical call may have cached this prompt already; skip
+        # the row rather than fail the transaction and lose the token billing
+        if response:
+            db.session.execute(
+                dialect_insert(ResponseCache)
+                .values(prompt_hash=prompt_hash, response=response, tokens=tokens,
+                        created_at=datetime.utcnow())
+                .on_conflict_do_nothing(index_elements=['prompt_hash'])
+            )
+        if tokens:
+            total_tokens = db.session.execute(token_usage_upsert(month, tokens)).scalar_one()
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Completion tracking error: {e}")
+        return
+    
+    if total_tokens is not None:
+        refresh_token_usage_cache(month, total_tokens)
+
+class QuestionCache(db.Model):
+    """Follow-up questions stored with the embedding of the summary they were asked about"""
+    __table_args__ = (
+        db.Index('ix_question_cache_user_mode_created', 'user_id', 'mode', 'created_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    mode = db.Column(db.String(20), nullable=False)
+    embedding = db.Column(db.Text, nullable=False)  # JSON list of floats, unit length
+    questions = db.Column(db.Text, nullable=False)  # JSON list of questions
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# Questions reference the summary's details, so lookups never cross users.
+# Only the most recent rows are compared to bound the pure-Python scan.
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', 0.92))
+SEMANTIC_CACHE_SCAN_LIMIT = 200
+
+def normalize_vector(vector):
+    """Scale a vector to unit length so cosine similarity is a dot product"""
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+def find_similar_questions(user_id, mode, embedding):
+    """Return cached questions for the closest earlier summary above the threshold"""
+    query = normalize_vector(embedding)
+    rows = db.session.execute(
+        db.select(QuestionCache.embedding, QuestionCache.questions)
+        .filter_by(user_id=user_id, mode=mode)
+        .order_by(QuestionCache.created_at.desc())
+        .limit(SEMANTIC_CACHE_SCAN_LIMIT)
+    ).all()
+    
+    best_score, best_questions = SEMANTIC_CACHE_THRESHOLD, None
+    for stored_embedding, questions in rows:
+        score = sum(map(operator.mul, query, json.loads(stored_embedding)))
+        if score >= best_score:
+            best_score, best_questions = score, questions
+    return json.loads(best_questions) if best_questions else None
+
+def cache_questions(user_id, mode, embedding, questions, tokens=0):
+    """Remember generated questions under their summary's embedding, billing tokens in the same commit"""
+    month = current_month()
+    total_tokens = None
+    try:
+        db.session.add(QuestionCache(
+            user_id=user_id,
+            mode=mode,
+            embedding=json.dumps([round(x, 6) for x in normalize_vector(embedding)]),
+            questions=json.dumps(questions)
+        ))
+        if tokens:
+            total_tokens = db.session.execute(token_usage_upsert(month, tokens)).scalar_one()
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Question cache error: {e}")
+        return
+    
+    if total_tokens is not None:
+        refresh_token_usage_cache(month, total_tokens)
+
+class PendingSummary(db.Model):
+    """Journal entry whose summary is still being generated by the Batch API"""
+    entry_id = db.Column(db.Integer, db.ForeignKey('journal_entry.id'), primary_key=True)
+    batch_id = db.Column(db.String(64), nullable=False)
+    checked_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+PENDING_SUMMARY_TEXT = "Your AI summary is being written and will appear here within 24 hours."
+BATCH_POLL_INTERVAL = timedelta(minutes=5)
+
+def collect_pending_summaries(user_id):
+    """Fill in any of the user's batch summaries that have finished
+    
+    Pages run this through ai.submit so they never wait on the Batch API;
+    a finished summary shows up on the next load.
+    """
+    if not ai.is_available():
+        return
+    due = datetime.utcnow() - BATCH_POLL_INTERVAL
+    pending = db.session.execute(
+        db.select(PendingSummary.entry_id, PendingSummary.batch_id)
+        .join(JournalEntry, JournalEntry.id == PendingSummary.entry_id)
+        .where(JournalEntry.user_id == user_id,
+               db.or_(PendingSummary.checked_at.is_(None), PendingSummary.checked_at < due))
+    ).all()
+    
+    for entry_id, batch_id in pending:
+        # Claim the row before calling the API so overlapping page loads
+        # never fetch and bill the same batch twice
+        claim = db.session.execute(
+            db.update(PendingSummary)
+            .where(PendingSummary.entry_id == entry_id,
+                   db.or_(PendingSummary.checked_at.is_(None), PendingSummary.checked_at < due))
+            .values(checked_at=datetime.utcnow())
+        )
+        db.session.commit()
+        if claim.rowcount != 1:
+            continue
+        
+        try:
+            status, summary, tokens = ai.fetch_batch_summary(batch_id)
+        except Exception as e:
+            ai._log_error(e)
+            continue
+        if status == 'pending':
+            continue
+        
+        month = current_month()
+        total_tokens = None
+        try:
+            done = db.session.execute(
+                db.delete(PendingSummary).where(PendingSummary.entry_id == entry_id)
+            )
+            if done.rowcount != 1:
+                db.session.rollback()
+                continue
+            entry = db.session.get(JournalEntry, entry_id)
+            if status == 'failed':
+                try:
+                    answers = json.loads(entry.answers) if entry.answers else []
+                except (ValueError, TypeError) as e:
+                    print(f"JSON parsing error: {e}, entry: {entry.id}")
+                    answers = []
+                summary = ai._get_fallback_conversational_summary(entry.daily_summary, answers, entry.mode)
+            entry.journal_content = summary
+            entry.tokens_used = tokens
+            if tokens:
+                total_tokens = db.session.execute(token_usage_upsert(month, tokens)).scalar_one()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Pending summary error: {e}")
+            continue
+        if total_tokens is not None:
+            refresh_token_usage_cache(month, total_tokens)
+
+def ensure_indexes():
+    """Create indexes that were added after their table already existed"""
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+
+# SQLite full-text index over entry text, kept in sync by triggers
+SEARCH_INDEX_DDL = [
+    """CREATE VIRTUAL TABLE journal_entry_fts USING fts5(
+        daily_summary, journal_content,
+        content='journal_entry', content_rowid='id', tokenize='porter unicode61'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS journal_entry_fts_insert AFTER INSERT ON journal_entry BEGIN
+        INSERT INTO journal_entry_fts(rowid, daily_summary, journal_content)
+        VALUES (new.id, new.daily_summary, new.journal_content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS journal_entry_fts_delete AFTER DELETE ON journal_entry BEGIN
+        INSERT INTO journal_entry_fts(journal_entry_fts, rowid, daily_summary, journal_content)
+        VALUES ('delete', old.id, old.daily_summary, old.journal_content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS journal_entry_fts_update AFTER UPDATE ON journal_entry BEGIN
+        INSERT INTO journal_entry_fts(journal_entry_fts, rowid, daily_summary, journal_content)
+        VALUES ('delete', old.id, old.daily_summary, old.journal_content);
+        INSERT INTO journal_entry_fts(rowid, daily_summary, journal_content)
+        VALUES (new.id, new.daily_summary, new.journal_content);
+    END""",
+    "INSERT INTO journal_entry_fts(journal_entry_fts) VALUES ('rebuild')"
+]
+
+def ensure_search_index():
+    """Create and backfill the SQLite FTS5 index for journal search"""
+    if db.engine.dialect.name != 'sqlite':
+        return
+    try:
+        with db.engine.begin() as conn:
+            exists = conn.execute(db.text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'journal_entry_fts'"
+            )).first()
+            if not exists:
+                for statement in SEARCH_INDEX_DDL:
+                    conn.execute(db.text(statement))
+    except Exception as e:
+        # Some SQLite builds ship without FTS5; search falls back to LIKE
+        print(f"Full-text search unavailable: {e}")
+
+def search_journal_entries(user_id, query, limit=20):
+    """Return a user's entries matching query, best matches first"""
+    if db.engine.dialect.name == 'sqlite':
+        # Quote each term so user input can't be parsed as FTS5 syntax
+        match = ' '.join('"' + term.replace('"', '""') + '"' for term in query.split())
+        try:
+            ids = db.session.execute(db.text(
+                "SELECT journal_entry.id FROM journal_entry_fts "
+                "JOIN journal_entry ON journal_entry.id = journal_entry_fts.rowid "
+                "WHERE journal_entry_fts MATCH :match AND journal_entry.user_id = :user_id "
+                "ORDER BY bm25(journal_entry_fts) LIMIT :limit"
+            ), {'match': match, 'user_id': user_id, 'limit': limit}).scalars().all()
+            entries = {entry.id: entry for entry in JournalEntry.query
+                       .options(load_only(*ENTRY_LIST_COLUMNS))
+                       .filter(JournalEntry.id.in_(ids)).all()}
+            return [entries[entry_id] for entry_id in ids]
+        except Exception as e:
+            db.session.rollback()
+            print(f"Full-text search error, falling back to LIKE: {e}")
+    
+    pattern = f"%{query}%"
+    return JournalEntry.query.filter_by(user_id=user_id)\
+        .options(load_only(*ENTRY_LIST_COLUMNS))\
+        .filter(db.or_(JournalEntry.daily_summary.ilike(pattern),
+                       JournalEntry.journal_content.ilike(pattern)))\
+        .order_by(JournalEntry.created_at.desc())\
+        .limit(limit).all()
+
 @login_manager.user_loader
 def load_user(user_id):
     return User.query.get(int(user_id))
@@ -577,8 +1184,11 @@ def login():
         password = data.get('password')
         
         user = User.query.filter_by(username=username).first()
-        if user and check_password_hash(user.password_hash, password):
+        if user and verify_password(user.password_hash, password):
             login_user(user)
+            # Upgrade older hashes while the plaintext is at hand; saved with last_login
+            if password_needs_rehash(user.password_hash):
+                user.password_hash = hash_password(password)
             user.last_login = datetime.utcnow()
             db.session.commit()
             return jsonify({'success': True, 'redirect': url_for('dashboard')})
@@ -611,7 +1221,7 @@ def register():
         user = User(
             username=username,
             email=email,
-            password_hash=generate_password_hash(password)
+            password_hash=hash_password(password)
         )
         db.session.add(user)
         db.session.commit()
@@ -644,8 +1254,10 @@ def change_admin_password():
     if not is_strong:
         return jsonify({'success': False, 'message': password_msg})
     
-    # Update password
-    current_user.password_hash = generate_password_hash(new_password)
+    # Update password with a single UPDATE statement
+    db.session.execute(
+        db.update(User).where(User.id == current_user.id).values(password_hash=hash_password(new_password))
+    )
     db.session.commit()
     
     return jsonify({'success': True, 'message': 'Password updated successfully'})
@@ -654,10 +1266,10 @@ def change_admin_password():
 @app.route('/dashboard')
 @login_required
 def dashboard():
+    ai.submit(collect_pending_summaries, current_user.id)
+    
     # Get recent journal entries
-    recent_entries = JournalEntry.query.filter_by(user_id=current_user.id)\
-        .order_by(JournalEntry.entry_date.desc())\
-        .limit(5).all()
+    recent_entries, next_cursor = get_entry_page(current_user.id, limit=5)
     
     # Get mood data for the last 7 days
     end_date = datetime.now().date()
@@ -670,7 +1282,9 @@ def dashboard():
     
     return render_template('dashboard.html', 
                          recent_entries=recent_entries,
-                         mood_data=mood_data)
+                         mood_data=mood_data,
+                         next_cursor=next_cursor,
+                         stats=get_user_stats(current_user.id))
 
 @app.route('/journal/new')
 @login_required
@@ -683,23 +1297,29 @@ def new_journal():
 def create_journal():
     data = request.get_json()
     daily_summary = sanitize_input(data.get('daily_summary', ''))
-    ai_questions = data.get('ai_questions', [])
-    user_answers = [sanitize_input(answer) for answer in data.get('user_answers', [])]
     ai_summary = sanitize_input(data.get('ai_summary', ''))
     mode = data.get('mode', 'quick')
+    generate_later = bool(data.get('generate_later')) and not ai_summary
+    
+    ai_questions = data.get('ai_questions', [])
+    user_answers = [sanitize_input(answer) for answer in data.get('user_answers', [])]
 
     # Store the AI questions and user answers
     questions_json = json.dumps(ai_questions)
     answers_json = json.dumps(user_answers)
     
-    # Use AI summary if provided, otherwise generate one
-    if not ai_summary:
-        try:
-            ai_summary, tokens = ai.generate_journal_summary(daily_summary, mode=mode)
-        except Exception as e:
-            print(f"AI error generating summary: {e}")
-            ai_summary = f"Today you experienced: {daily_summary[:100]}... You reflected on your feelings and responses to these events."
-            tokens = 0
+    # Overnight summaries go through the cheaper Batch API and are filled in
+    # when the batch finishes; if it can't be queued, write the summary now
+    batch_id = None
+    if generate_later:
+        batch_id = ai.submit_summary_batch(daily_summary, user_answers, mode=mode, questions=ai_questions)
+        if batch_id:
+            ai_summary, tokens = PENDING_SUMMARY_TEXT, 0
+        else:
+            ai_summary, tokens = ai.generate_conversational_summary(daily_summary, user_answers, mode=mode, questions=ai_questions)
+    elif not ai_summary:
+        # No AI summary was provided, so generate one (falls back on AI failure)
+        ai_summary, tokens = ai.generate_journal_summary(daily_summary, mode=mode)
     else:
         tokens = 0  # Summary was already generated
 
@@ -715,12 +1335,18 @@ def create_journal():
     )
     
     db.session.add(entry)
+    # The flush's INSERT hands back the new id; reading it after commit would
+    # expire the entry and cost a second SELECT
+    db.session.flush()
+    entry_id = entry.id
+    if batch_id:
+        db.session.add(PendingSummary(entry_id=entry_id, batch_id=batch_id))
     db.session.commit()
     
     return jsonify({
         'success': True, 
         'message': 'Journal entry created successfully!',
-        'entry_id': entry.id
+        'entry_id': entry_id
     })
 
 @app.route('/journal/<int:entry_id>')
@@ -729,6 +1355,7 @@ def view_journal(entry_id):
     entry = JournalEntry.query.get_or_404(entry_id)
     if entry.user_id != current_user.id:
         return redirect(url_for('dashboard'))
+    ai.submit(collect_pending_summaries, current_user.id)
     
     # Debug: Print what's stored in the database
     print(f"Viewing journal entry {entry_id}:")
@@ -736,7 +1363,93 @@ def view_journal(entry_id):
     print(f"Answers (raw): {entry.answers}")
     print(f"Tokens used: {entry.tokens_used}")
     
-    return render_template('view_journal.html', entry=entry)
+    # Parse the stored question list once here rather than in the template
+    try:
+        questions = json.loads(entry.questions) if entry.questions else []
+    except (ValueError, TypeError) as e:
+        print(f"JSON parsing error: {e}, value: {repr(entry.questions)}")
+        questions = []
+    
+    return render_template('view_journal.html', entry=entry, questions=questions)
+
+@app.route('/journal/<int:entry_id>/download')
+@login_required
+def download_journal(entry_id):
+    """Download a single journal entry as a text file"""
+    entry = JournalEntry.query.get_or_404(entry_id)
+    if entry.user_id != current_user.id:
+        return redirect(url_for('dashboard'))
+    
+    filename = f"mindflow_journal_{entry.entry_date.strftime('%Y-%m-%d')}.txt"
+    return Response(
+        format_entry_text(entry),
+        mimetype='text/plain; charset=utf-8',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+@app.route('/api/journal/entries')
+@login_required
+def list_journals():
+    """Page through the current user's journal entries, newest first"""
+    cursor = request.args.get('cursor')
+    try:
+        entries, next_cursor = get_entry_page(current_user.id, cursor=cursor)
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid cursor'}), 400
+    
+    return jsonify({
+        'success': True,
+        'entries': [{
+            'id': entry.id,
+            'entry_date': entry.entry_date.strftime('%B %d, %Y'),
+            'mode': entry.mode,
+            'preview': entry.daily_summary[:150],
+            'truncated': len(entry.daily_summary) > 150,
+            'url': url_for('view_journal', entry_id=entry.id)
+        } for entry in entries],
+        'next_cursor': next_cursor
+    })
+
+@app.route('/api/journal/search')
+@login_required
+def search_journals():
+    """Full-text search over the current user's journal entries"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'success': False, 'message': 'Search query is required'})
+    
+    entries = search_journal_entries(current_user.id, query)
+    return jsonify({
+        'success': True,
+        'results': [{
+            'id': entry.id,
+            'entry_date': entry.entry_date.strftime('%B %d, %Y'),
+            'mode': entry.mode,
+            'preview': entry.daily_summary[:150],
+            'url': url_for('view_journal', entry_id=entry.id)
+        } for entry in entries]
+    })
+
+@app.route('/journal/export')
+@login_required
+def export_journals():
+    """Download every journal entry for the current user as one zip archive"""
+    entries = JournalEntry.query.filter_by(user_id=current_user.id)\
+        .order_by(JournalEntry.entry_date.desc()).all()
+    
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for entry in entries:
+            filename = f"mindflow_journal_{entry.entry_date.strftime('%Y-%m-%d')}_{entry.id}.txt"
+            archive.writestr(filename, format_entry_text(entry))
+    buffer.seek(0)
+    
+    return send_file(
+        buffer,
+        mimetype='application/zip',
+        as_attachment=True,
+        download_name='mindflow_journal_export.zip'
+    )
 
 # UPDATED: now calls AIService with graceful fallback
 @app.route('/api/generate-questions', methods=['POST'])
@@ -753,20 +1466,7 @@ def generate_questions():
         questions, tokens = ai.generate_reflection_questions(daily_summary, mode=mode)
     except Exception as e:
         print(f"AI error in /api/generate-questions: {e}")
-        if mode == 'quick':
-            questions = [
-                "What emotions did you experience today?",
-                "What did you learn about yourself?",
-                "How did you handle challenges?"
-            ]
-        else:
-            questions = [
-                "What emotions did you experience today?",
-                "What did you learn about yourself?",
-                "How did you handle challenges?",
-                "What relationships were important today?",
-                "What would you do differently?"
-            ]
+        questions = ai._get_fallback_questions(mode)
         tokens = 0
     
     return jsonify({
@@ -792,18 +1492,7 @@ def generate_live_insights():
     except Exception as e:
         print(f"AI error in /api/generate-live-insights: {e}")
         # Provide encouraging fallback insights
-        if mode == 'quick':
-            insights = [
-                "Your reflection is developing nicely!",
-                "Keep writing to explore your thoughts further.",
-                "This is a great start to your journal entry."
-            ]
-        else:
-            insights = [
-                "Your detailed reflection shows deep thinking.",
-                "Consider how this experience relates to your broader life.",
-                "You're building valuable self-awareness through this process."
-            ]
+        insights = ai._get_fallback_insights(mode)
         tokens = 0
     
     return jsonify({
@@ -867,13 +1556,11 @@ def generate_ai_response():
         
         # Provide helpful fallback responses
         if response_type == 'summary':
-            fallback = f"Based on your summary: '{daily_summary[:50]}...', I can see you've had an eventful day. Keep writing to explore your thoughts further."
+            fallback = ai._get_fallback_summary(daily_summary, mode)
         elif response_type == 'content':
-            fallback = "I'm reading your journal entry and finding it very insightful. Consider exploring how this experience relates to your broader life goals and values."
-        elif response_type == 'mood':
-            mood_emojis = {'happy': '😊', 'calm': '😌', 'neutral': '😐', 'anxious': '😰', 'sad': '😢'}
-            emoji = mood_emojis.get(mood, '😊')
-            fallback = f"I notice you're feeling {mood} {emoji}. This mood can provide valuable context for understanding your day. How does this feeling relate to what happened today?"
+            fallback = ai._get_fallback_assistant_response(mode)
+        else:
+            fallback = ai._get_fallback_mood_response(mood, mode)
         
         print(f"Using fallback response: {fallback[:100]}...")
         
@@ -908,7 +1595,7 @@ def generate_ai_questions():
     
     try:
         print(f"Calling AI service...")
-        questions, tokens = ai.generate_conversational_questions(daily_summary, mode=mode)
+        questions, tokens = ai.generate_conversational_questions(daily_summary, mode=mode, user_id=current_user.id)
         print(f"AI Success! Questions: {questions}")
         print(f"Tokens used: {tokens}")
         
@@ -924,21 +1611,7 @@ def generate_ai_questions():
         print(f"Full traceback: {traceback.format_exc()}")
         
         # Provide fallback questions
-        if mode == 'quick':
-            questions = [
-                "How did you feel about what happened today?",
-                "What was the most challenging part of your day?",
-                "What would you do differently if you could?"
-            ]
-        else:
-            questions = [
-                "How did you feel about what happened today?",
-                "What was the most challenging part of your day?",
-                "What emotions came up during these events?",
-                "How did you handle any difficult situations?",
-                "What did you learn about yourself today?",
-                "What would you do differently if you could?"
-            ]
+        questions = ai._get_fallback_conversational_questions(mode)
         
         print(f"Using fallback questions: {questions}")
         
@@ -956,13 +1629,21 @@ def generate_journal_summary():
     data = request.get_json()
     daily_summary = data.get('daily_summary', '')
     user_answers = data.get('user_answers', [])
+    questions = data.get('questions', [])
     mode = data.get('mode', 'quick')
     
     if not daily_summary:
         return jsonify({'success': False, 'message': 'Daily summary is required'})
     
+    # Streamed summaries are sent as plain text so the page can render them as they arrive
+    if data.get('stream'):
+        return Response(
+            stream_with_context(ai.stream_conversational_summary(daily_summary, user_answers, mode=mode, questions=questions)),
+            mimetype='text/plain; charset=utf-8'
+        )
+    
     try:
-        summary, tokens = ai.generate_conversational_summary(daily_summary, user_answers, mode=mode)
+        summary, tokens = ai.generate_conversational_summary(daily_summary, user_answers, mode=mode, questions=questions)
         return jsonify({
             'success': True,
             'summary': summary,
@@ -971,7 +1652,7 @@ def generate_journal_summary():
     except Exception as e:
         print(f"AI error in /api/generate-journal-summary: {e}")
         # Provide fallback summary
-        fallback = f"Today you experienced: {daily_summary[:100]}... You reflected on your feelings and responses to these events. Your answers show thoughtful consideration of your experiences."
+        fallback = ai._get_fallback_conversational_summary(daily_summary, user_answers, mode)
         
         return jsonify({
             'success': True,
@@ -982,7 +1663,9 @@ def generate_journal_summary():
 @app.route('/profile')
 @login_required
 def profile():
-    return render_template('profile.html')
+    stats = get_user_stats(current_user.id)
+    recent_entries, _ = get_entry_page(current_user.id, limit=5)
+    return render_template('profile.html', stats=stats, recent_entries=recent_entries)
 
 @app.route('/api/mood', methods=['POST'])
 @login_required
@@ -1016,6 +1699,7 @@ def save_mood():
         db.session.add(new_entry)
     
     db.session.commit()
+    invalidate_mood_analytics(current_user.id)
     return jsonify({'success': True, 'message': 'Mood saved successfully!'})
 
 @app.route('/mood-checkin')
@@ -1038,6 +1722,11 @@ def get_mood_analytics():
     end_date = datetime.now().date()
     start_date = end_date - timedelta(days=days)
     
+    cache_key = (current_user.id, days, end_date)
+    cached = get_cached_mood_analytics(cache_key)
+    if cached is not None:
+        return jsonify(cached)
+    
     # Get mood entries for the specified date range
     mood_entries = MoodEntry.query.filter(
         MoodEntry.user_id == current_user.id,
@@ -1055,7 +1744,7 @@ def get_mood_analytics():
             'created_at': entry.created_at.strftime('%Y-%m-%d %H:%M:%S')
         })
     
-    return jsonify({
+    payload = {
         'success': True,
         'mood_data': mood_data,
         'total_entries': len(mood_data),
@@ -1063,7 +1752,10 @@ def get_mood_analytics():
             'start': start_date.strftime('%Y-%m-%d'),
             'end': end_date.strftime('%Y-%m-%d')
         }
-    })
+    }
+    cache_mood_analytics(cache_key, payload)
+    
+    return jsonify(payload)
 
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
@@ -4,7 +4,7 @@ MindFlow - Flask Application Startup Script
 """
 
 import os
-from app import app, db
+from app import app, db, ensure_indexes, ensure_search_index, hash_password
 
 if __name__ == '__main__':
     # Set environment
@@ -13,16 +13,17 @@ if __name__ == '__main__':
     # Create database tables
     with app.app_context():
         db.create_all()
+        ensure_indexes()
+        ensure_search_index()
         
         # Create admin user if not exists
         from app import User
         admin = User.query.filter_by(username='admin').first()
         if not admin:
-            from werkzeug.security import generate_password_hash
             admin = User(
                 username='admin',
                 email='admin@mindflow.com',
-                password_hash=generate_password_hash('admin123'),
+                password_hash=hash_password('admin123'),
                 role='admin'
             )
             db.session.add(admin)